@@ -0,0 +1,175 @@
+import os
+import sys
+import glob
+import json
+import time
+import pathlib
+import argparse
+import platform
+import tempfile
+import warnings
+import datetime
+
+import polars as pl
+
+from cenalert.lib.detection import ChebyshevInequality, MedianMethod, IsolationForest, LocalOutlierFactor
+from cenalert.lib.event_match import match_all
+from cenalert.lib.synthetic import REGIMES, RESOLUTIONS, generate_countries
+
+BENCHMARKS = ["detect", "stitch", "tune", "match", "synthetic"]
+
+# parameters for algorithms without selected parameters in the repository
+DEFAULT_PARAMETERS = {
+    "median": {"half_neighborhood": 15, "min_score": 1, "min_residual": 10, "efficiency": 0.05},
+    "iforest": {"window": 60, "min_score": 0.8, "min_residual": 10, "efficiency": 0.05},
+    "lof": {"window": 60, "min_score": 2, "min_residual": 10, "efficiency": 0.05},
+}
+
+def make_detector(algorithm, country=None, parameters="parameters/chebyshev_selected"):
+    if algorithm == "chebyshev":
+        path = os.path.join(parameters, f"{country}.json")
+        selected = json.load(open(path)) if country and os.path.exists(path) else [60, 3, 6, 1, 0.05]
+        selected[0] = round(selected[0])
+        return ChebyshevInequality(*selected)
+    elif algorithm == "median":
+        return MedianMethod(**DEFAULT_PARAMETERS[algorithm])
+    elif algorithm == "iforest":
+        return IsolationForest(**DEFAULT_PARAMETERS[algorithm])
+    elif algorithm == "lof":
+        return LocalOutlierFactor(**DEFAULT_PARAMETERS[algorithm])
+
+def timeit(function, repeat=5, max_time=60):
+    """
+    Runs `function` `repeat` times and returns timing statistics (in seconds). Repetition stops early
+    once `max_time` seconds have been spent, so that long benchmarks (e.g., tuning) run only once.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+        if sum(timings) >= max_time: break
+    return {"min": min(timings), "mean": sum(timings) / len(timings), "repeat": len(timings)}
+
+def bench_detect(args):
+    for algorithm in args.algorithms:
+        for country in args.countries:
+            df = pl.read_csv(os.path.join(args.series, f"{country}.csv"), try_parse_dates=True)
+            if args.points: df = df.head(args.points)
+            yield f"detect/{algorithm}/{country}", timeit(lambda: make_detector(algorithm, country).run(df), args.repeat, args.max_time)
+
+def bench_stitch(args):
+    from cenalert.lib.stitching import combine_and_stitch
+
+    for country in args.stitch_countries:
+        windows = glob.glob(os.path.join(args.raw_data, "**", "output*", country, "**", "*.csv"), recursive=True)
+        sample_dirs = sorted({pathlib.Path(window).parent for window in windows})
+        if not sample_dirs: continue
+        yield f"stitch/{country}", timeit(lambda: combine_and_stitch(sample_dirs), args.repeat, args.max_time)
+
+def bench_tune(args):
+    from cenalert.tune_parameters import run_hyperparameter_tuning
+
+    country = args.countries[0]
+    df = pl.read_csv(os.path.join(args.series, f"{country}.csv"), try_parse_dates=True)
+    if args.points: df = df.head(args.points)
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "front.pkl")
+        # tuning prints every evaluated parameter set
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                result = timeit(lambda: run_hyperparameter_tuning(df, "chebyshev", output, n_eval=args.n_eval), args.repeat, args.max_time)
+            finally:
+                sys.stdout = stdout
+    yield f"tune/chebyshev/{country}/{args.n_eval}", result
+
+def bench_match(args):
+    for country in args.countries:
+        df = pl.read_csv(os.path.join(args.series, f"{country}.csv"), try_parse_dates=True)
+        events = pl.read_csv(os.path.join(args.events, f"{country}.csv"), try_parse_dates=True)
+        detector = make_detector("chebyshev", country)
+        detector.run(df)
+        anomalies = detector.anomalies()
+        yield f"match/{country}", timeit(lambda: match_all(anomalies, events), args.repeat, args.max_time)
+
+def bench_synthetic(args):
+    name = f"synthetic/{args.synthetic_regime}/{args.synthetic_resolution}/{args.synthetic_countries}x{args.synthetic_years}y"
+
+    def run():
+        for _, df in generate_countries(args.synthetic_countries, years=args.synthetic_years, resolution=args.synthetic_resolution,
+                                        regime=args.synthetic_regime, seed=0):
+            make_detector("chebyshev").run(df)
+
+    yield name, timeit(run, args.repeat, args.max_time)
+
+def compare(results, baseline, tolerance, min_time=1.0):
+    """
+    Compares results against a baseline, printing the ratio of the best timings.
+    Returns the names of benchmarks which are slower than the baseline by more than `tolerance`.
+    Benchmarks which take less than `min_time` seconds in the baseline are dominated by noise, so they are only reported.
+    """
+    regressions = []
+    print(f"{'benchmark':<50} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<50} {'-':>10} {result['min']:>10.3f} {'-':>7}")
+            continue
+        ratio = result["min"] / baseline[name]["min"]
+        checked = baseline[name]["min"] >= min_time
+        print(f"{name:<50} {baseline[name]['min']:>10.3f} {result['min']:>10.3f} {ratio:>7.2f}{'' if checked else ' (not checked)'}")
+        if checked and ratio > 1 + tolerance: regressions.append(name)
+    return regressions
+
+def main():
+    warnings.filterwarnings("ignore")
+
+    parser = argparse.ArgumentParser(description="Benchmark anomaly detection, stitching, parameter tuning and event matching")
+    parser.add_argument("--benchmarks", nargs="+", default=["detect", "stitch", "tune", "match"], choices=BENCHMARKS, help="benchmarks to run")
+    parser.add_argument("--series", default="series/012t0g", help="path to time series directory")
+    parser.add_argument("--events", default="events/by_country", help="path to events directory")
+    parser.add_argument("--raw-data", default="raw_data", help="path to raw window data")
+    parser.add_argument("--countries", nargs="+", default=["RU", "TR"], help="countries to run detection, tuning and matching on")
+    parser.add_argument("--stitch-countries", nargs="+", default=["TR"], help="countries to stitch")
+    parser.add_argument("--algorithms", nargs="+", default=["chebyshev", "median"], choices=["chebyshev", "median", "iforest", "lof"], help="algorithms to run detection with")
+    parser.add_argument("--points", type=int, help="only use the first POINTS values of each time series")
+    parser.add_argument("--n-eval", type=int, default=100, help="evaluation budget for the tuning benchmark (NSGA2 evaluates at least one population of 100)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times to run each benchmark (the best time is reported)")
+    parser.add_argument("--max-time", type=float, default=60, help="stop repeating a benchmark once it has run for this many seconds")
+    parser.add_argument("--synthetic-countries", type=int, default=1, help="number of synthetic countries")
+    parser.add_argument("--synthetic-years", type=int, default=14, help="length of synthetic series in years")
+    parser.add_argument("--synthetic-resolution", default="daily", choices=list(RESOLUTIONS), help="resolution of synthetic series")
+    parser.add_argument("--synthetic-regime", default="smooth", choices=REGIMES, help="regime of synthetic series")
+    parser.add_argument("--output", help="path to output results (JSON)")
+    parser.add_argument("--baseline", help="path to baseline results (JSON) to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown relative to the baseline")
+    parser.add_argument("--min-time", type=float, default=1.0, help="only check benchmarks taking at least this many seconds in the baseline for regressions")
+    args = parser.parse_args()
+
+    try:
+        baseline = json.load(open(args.baseline))["results"] if args.baseline else None
+    except FileNotFoundError as e:
+        print(e)
+        exit(1)
+
+    benchmarks = {"detect": bench_detect, "stitch": bench_stitch, "tune": bench_tune, "match": bench_match, "synthetic": bench_synthetic}
+
+    results = {}
+    for benchmark in args.benchmarks:
+        for name, result in benchmarks[benchmark](args):
+            print(f"{name}: {result['min']:.3f}s")
+            results[name] = result
+
+    if args.output:
+        metadata = {"timestamp": datetime.datetime.now().isoformat(), "python": platform.python_version(), "machine": platform.machine(), "arguments": vars(args)}
+        with open(args.output, "w") as file: json.dump({"metadata": metadata, "results": results}, file, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.min_time)
+        if regressions:
+            print("Regressions:", " ".join(regressions))
+            exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import argparse
+
+from cenalert.lib.matrix import build_matrix
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a directory of per-country time series into a single memory-mappable matrix")
+    parser.add_argument("--series", required=True, help="path to time series directory")
+    parser.add_argument("--output", required=True, help="path to output matrix directory")
+    args = parser.parse_args()
+
+    try:
+        countries, days = build_matrix(args.series, args.output)
+    except (FileNotFoundError, ValueError) as e:
+        print(e)
+        exit(1)
+
+    print(f"Saved {countries} countries × {days} dates to {args.output}.")
+
+if __name__ == "__main__":
+    main()
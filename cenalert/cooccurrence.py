@@ -0,0 +1,48 @@
+import argparse
+import datetime
+
+import polars as pl
+
+from cenalert.lib.cooccurrence import SpikeIndex, load_spikes
+
+def write(df, path):
+    if path.endswith(".parquet"): df.write_parquet(path)
+    else: df.write_csv(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find spikes which co-occur across countries")
+    parser.add_argument("--results", required=True, help="path to per-country results (<CC>/anomalies.csv) or a consolidated dataset")
+    parser.add_argument("--algorithm", required=False, help="only use spikes detected by this algorithm (consolidated dataset only)")
+    parser.add_argument("--days", type=int, default=6, help="maximum number of days between the starts of co-occurring spikes")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="only list the spikes within --days days of this date (YYYY-MM-DD)")
+    parser.add_argument("--min-countries", type=int, default=2, help="minimum number of countries in a reported cluster")
+    parser.add_argument("--output", required=False, help="path to output clusters (CSV or Parquet)")
+    parser.add_argument("--spikes", required=False, help="path to output spikes with their cluster (CSV or Parquet)")
+    args = parser.parse_args()
+
+    try:
+        index = SpikeIndex(load_spikes(args.results, algorithm=args.algorithm))
+    except FileNotFoundError as e:
+        print(e)
+        exit(1)
+
+    if args.date:
+        matches = index.query(args.date, args.days)
+        with pl.Config(tbl_rows=-1):
+            print(matches)
+        print(f"{matches['country'].n_unique()} countries spiked within {args.days} days of {args.date}")
+        if args.output: write(matches, args.output)
+        return
+
+    spikes, clusters = index.cluster(args.days)
+    clusters = clusters.filter(pl.col("n_countries") >= args.min_countries)
+
+    with pl.Config(tbl_rows=20, fmt_str_lengths=80):
+        print(clusters.sort("n_countries", "impact", descending=True))
+    print(f"{len(clusters)} clusters spanning at least {args.min_countries} countries ({len(spikes)} spikes)")
+
+    if args.output: write(clusters, args.output)
+    if args.spikes: write(spikes, args.spikes)
+
+if __name__ == "__main__":
+    main()
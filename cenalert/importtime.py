@@ -0,0 +1,72 @@
+import sys
+import argparse
+import subprocess
+
+CLIS = ["cenalert.run", "cenalert.tune_parameters", "cenalert.select_parameters", "cenalert.stitch_windows"]
+
+def parse_importtime(stderr: str):
+    """
+    Parses the output of `python -X importtime` into (module, self, cumulative, depth) tuples.
+    Times are in microseconds; depth is the nesting level of the import.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line: continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+def measure(module: str, repeat=3):
+    """
+    Measures the cumulative time (in microseconds) taken to import a module in a fresh interpreter.
+    Returns the best of `repeat` runs along with the module's direct imports in that run.
+    """
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise ImportError(f"could not import {module}: {result.stderr.strip().splitlines()[-1]}")
+
+        entries = parse_importtime(result.stderr)
+        index = max(i for i, entry in enumerate(entries) if entry[0] == module and entry[3] == 0)
+        total = entries[index][2]
+
+        # entries are reported children first, so the module's imports precede it up to the previous top-level import
+        start = max((i + 1 for i, entry in enumerate(entries[:index]) if entry[3] == 0), default=0)
+        children = [entry for entry in entries[start:index] if entry[3] == 1]
+
+        if best is None or total < best[0]: best = (total, children)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time of the CenAlert command line tools")
+    parser.add_argument("--modules", nargs="+", default=CLIS, help="modules to measure")
+    parser.add_argument("--budget", type=float, default=1500, help="maximum import time per module in milliseconds")
+    parser.add_argument("--repeat", type=int, default=3, help="number of measurements per module (best is reported)")
+    parser.add_argument("--top", type=int, default=5, help="number of heaviest imports to show per module")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        try:
+            total, entries = measure(module, args.repeat)
+        except ImportError as e:
+            print(e)
+            exit(1)
+
+        status = "OK" if total / 1000 <= args.budget else "OVER BUDGET"
+        print(f"{module}: {total / 1000:.1f} ms (budget {args.budget:.0f} ms) {status}")
+
+        heaviest = sorted(entries, key=lambda entry: entry[2], reverse=True)
+        for name, _, cumulative, _ in heaviest[:args.top]:
+            print(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+        if total / 1000 > args.budget: over_budget.append(module)
+
+    if over_budget:
+        print("Over budget:", " ".join(over_budget))
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+
+import polars as pl
+
+import cenalert.lib.detection
+import cenalert.lib.event_match
+
+DEFAULT_CACHE_DIRECTORY = os.environ.get("CENALERT_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "cenalert"))
+
+def file_hash(path):
+    """
+    Returns the SHA-256 digest of a file's contents, or None if no path is given.
+    """
+    if path is None: return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""): digest.update(block)
+    return digest.hexdigest()
+
+def detector_version():
+    """
+    Identifies the detector implementation by the digest of its source, so that cached results
+    are invalidated whenever anomaly detection changes.
+    """
+    return file_hash(cenalert.lib.detection.__file__)
+
+def matches_key(events_path):
+    """
+    Identifies matched anomalies by the contents of the events file and the digest of the event matching code,
+    so that cached matches are recomputed whenever either changes.
+    """
+    description = json.dumps([file_hash(events_path), file_hash(cenalert.lib.event_match.__file__)])
+    return hashlib.sha256(description.encode()).hexdigest()
+
+def detection_key(series_hash, algorithm, parameters):
+    """
+    Returns the cache key for running `algorithm` with `parameters` on a series with content hash `series_hash`.
+    """
+    description = json.dumps([series_hash, algorithm, [float(parameter) for parameter in parameters], detector_version()])
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+class ResultCache():
+    """
+    Content-addressed cache of anomaly detection results. Each entry is a directory containing the
+    annotated series and detected anomalies, along with the anomalies matched against the most recent events file.
+    Least recently used entries are evicted once the cache grows beyond `max_size` bytes.
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_size=1 << 30):
+        self._directory = directory
+        self._max_size = max_size
+
+    def _path(self, key):
+        return os.path.join(self._directory, key)
+
+    def load(self, key):
+        """
+        Returns the cached entry for `key` as a dictionary with annotated, anomalies, matches and
+        events (the matches_key that matches was computed with), or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, "metadata.json")) as file: metadata = json.load(file)
+            entry = {
+                "annotated": pl.read_parquet(os.path.join(path, "annotated.parquet")),
+                "anomalies": pl.read_parquet(os.path.join(path, "anomalies.parquet")),
+                "events": metadata["events"],
+                "matches": pl.read_parquet(os.path.join(path, "matches.parquet")),
+            }
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            return None
+
+        os.utime(path)
+        return entry
+
+    def store(self, key, annotated, anomalies, events_hash, matches):
+        """
+        Stores the results of a run. An existing entry for `key` is replaced atomically.
+        """
+        os.makedirs(self._directory, exist_ok=True)
+        staging = self._path(f".{key}.{uuid.uuid4().hex}")
+        os.makedirs(staging)
+
+        annotated.write_parquet(os.path.join(staging, "annotated.parquet"))
+        anomalies.write_parquet(os.path.join(staging, "anomalies.parquet"))
+        matches.write_parquet(os.path.join(staging, "matches.parquet"))
+        with open(os.path.join(staging, "metadata.json"), "w") as file: json.dump({"events": events_hash}, file)
+
+        shutil.rmtree(self._path(key), ignore_errors=True)
+        try:
+            os.rename(staging, self._path(key))
+        except OSError:
+            # another process stored the same entry concurrently
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict()
+
+    def store_matches(self, key, events_hash, matches):
+        """
+        Replaces the matched anomalies of an existing entry after the events file has changed.
+        """
+        path = self._path(key)
+        staging = os.path.join(path, f".{uuid.uuid4().hex}")
+        matches.write_parquet(staging + ".parquet")
+        os.replace(staging + ".parquet", os.path.join(path, "matches.parquet"))
+        with open(staging + ".json", "w") as file: json.dump({"events": events_hash}, file)
+        os.replace(staging + ".json", os.path.join(path, "metadata.json"))
+
+    def size(self, key):
+        path = self._path(key)
+        return sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache is no larger than its maximum size.
+        """
+        entries = []
+        for key in os.listdir(self._directory):
+            if key.startswith("."): continue
+            try:
+                entries.append((os.path.getmtime(self._path(key)), self.size(key), key))
+            except FileNotFoundError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self._max_size: break
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
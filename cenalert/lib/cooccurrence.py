@@ -0,0 +1,90 @@
+import os
+import glob
+import datetime
+
+import numpy as np
+import polars as pl
+
+SPIKE_COLUMNS = ["country", "start", "end", "peak", "impact"]
+
+def load_spikes(path, algorithm=None):
+    """
+    Loads the spikes detected for all countries, either from a consolidated dataset (see cenalert.lib.output)
+    or from a directory of per-country results (<path>/<CC>/anomalies.csv, as written by run.sh or the pipeline).
+
+    Spikes of hourly series are truncated to their day.
+
+    Returns:
+        DataFrame: One row per spike with country, start, end, peak and impact
+    """
+    if os.path.isdir(os.path.join(path, "anomalies")) and glob.glob(os.path.join(path, "anomalies", "**", "*.parquet"), recursive=True):
+        from cenalert.lib.output import scan_dataset
+        spikes = scan_dataset(path, "anomalies")
+        if algorithm: spikes = spikes.filter(pl.col("algorithm") == algorithm)
+        return spikes.select(SPIKE_COLUMNS).with_columns(pl.col("start", "end", "peak").cast(pl.Date)).collect()
+
+    frames = []
+    for file in sorted(glob.glob(os.path.join(path, "*", "anomalies.csv"))):
+        country = os.path.basename(os.path.dirname(file))
+        # dates are parsed explicitly, since header-only files (countries without spikes) have no values to infer them from
+        anomalies = pl.read_csv(file, columns=SPIKE_COLUMNS[1:], schema_overrides={"start": pl.String, "end": pl.String, "peak": pl.String, "impact": pl.Float64})
+        anomalies = anomalies.with_columns(pl.col("start", "end", "peak").str.to_datetime().cast(pl.Date), pl.lit(country).alias("country"))
+        frames.append(anomalies.select(SPIKE_COLUMNS))
+
+    if not frames: raise FileNotFoundError(f"No anomalies found in {path}")
+    return pl.concat(frames)
+
+
+class SpikeIndex():
+    """
+    Interval index over the spikes of all countries. Spikes are sorted by start date, so a window query
+    takes two binary searches (bounded by the longest spike) and clustering one binary search per cluster.
+    """
+    def __init__(self, spikes: pl.DataFrame):
+        self.spikes = spikes.sort("start", "country")
+        self._starts = self.spikes["start"].to_numpy()
+        self._longest = (self.spikes["end"] - self.spikes["start"]).max() if len(self.spikes) else datetime.timedelta(0)
+
+    def query(self, date, days=0):
+        """
+        Returns the spikes which overlap [date - days, date + days], along with the distance (in days)
+        between the spike and the date (0 if the date falls within the spike).
+        """
+        low, high = date - datetime.timedelta(days=days), date + datetime.timedelta(days=days)
+        # any spike overlapping the window starts no earlier than the window minus the longest spike
+        first = np.searchsorted(self._starts, np.datetime64(low - self._longest), side="left")
+        last = np.searchsorted(self._starts, np.datetime64(high), side="right")
+
+        return self.spikes[first:last].filter(pl.col("end") >= low).with_columns(
+            pl.when(pl.col("start") > date).then((pl.col("start") - date).dt.total_days())
+              .when(pl.col("end") < date).then((pl.col("end") - date).dt.total_days())
+              .otherwise(0).alias("distance"))
+
+    def cluster(self, days=0):
+        """
+        Groups spikes into co-occurrence clusters. The earliest spike not yet in a cluster opens a new cluster,
+        which contains every spike starting at most `days` days after it, so all spikes in a cluster start within
+        `days` days of each other (spikes are not chained across clusters).
+
+        Returns:
+            tuple: (spikes with a cluster column, one row per cluster with its date range, countries and summed impact)
+        """
+        starts = self._starts.astype("datetime64[D]")
+        first, anchors = 0, []
+        while first < len(starts):
+            anchors.append(first)
+            first = np.searchsorted(starts, starts[first] + np.timedelta64(days, "D"), side="right")
+
+        cluster = np.searchsorted(np.array(anchors, dtype=np.int64), np.arange(len(starts)), side="right")
+        spikes = self.spikes.with_columns(pl.Series("cluster", cluster, dtype=pl.UInt32))
+
+        clusters = spikes.group_by("cluster").agg(
+            pl.col("start").min(),
+            pl.col("end").max(),
+            pl.col("peak").sort_by("impact", descending=True).first(),
+            pl.len().alias("spikes"),
+            pl.col("country").n_unique().alias("n_countries"),
+            pl.col("country").unique().sort().str.join(",").alias("countries"),
+            pl.col("impact").sum()).sort("cluster")
+
+        return spikes, clusters
@@ -6,12 +6,13 @@ import numpy as np
 
 from scipy.stats import shapiro
 from scipy.stats.mstats import winsorize
+from scipy.optimize import minimize_scalar
 from more_itertools import consecutive_groups
 
-import isotree
-import sklearn.neighbors
-import statsforecast.models
-from scipy.optimize import minimize_scalar
+from cenalert.lib.instrumentation import NULL_INSTRUMENTATION
+
+# algorithm backends (isotree, sklearn, statsforecast) are imported
+# where they are first needed so that e.g. ChebyshevInequality does not pay for them
 
 class DemandCategorization(StrEnum):
     ERRATIC = "erratic"
@@ -21,6 +22,11 @@ class DemandCategorization(StrEnum):
     NONE = "none"
 
 
+ANNOTATION_SCHEMA = [("anomaly", pl.Boolean), ("score", pl.Float64), ("residual", pl.Float64), ("threshold", pl.Float64), ("min_score", pl.Float64),
+                     ("cov2", pl.Float64), ("adi", pl.Float64), ("demand_pattern", pl.String)]
+ANOMALY_SCHEMA = ["start", "end", "peak", ("score", float), ("residual", float), ("impact", float)]
+
+
 class Window():
     def __init__(self, min_observations=None):
         self._min_observations = min_observations
@@ -138,6 +144,8 @@ class EfficiencyRatio(ExpandingWindow):
 
 class CrostonSBA:
     def __init__(self, window: np.array):
+        import statsforecast.models
+
         self._window = window
         self._sba = statsforecast.models.CrostonSBA()
 
@@ -154,6 +162,9 @@ class AnomalyDetector(ABC):
         self._efficiency_ratio = EfficiencyRatio()
         self._min_residual = min_residual
         self._efficiency = efficiency
+        self.instrumentation = NULL_INSTRUMENTATION
+        self._index = 0
+        self._previous = None
     
     @abstractmethod
     def score(self, value):
@@ -163,108 +174,164 @@ class AnomalyDetector(ABC):
     def threshold(self, initial_guess):
         return NotImplementedError
     
+    @staticmethod
+    def _collective_anomaly_to_tuple(collective_anomaly: pl.DataFrame):
+        start_date, end_date = collective_anomaly[[0, -1], "date"]
+        peak = collective_anomaly[collective_anomaly["value"].arg_max(), "date"]
+        score = collective_anomaly[0, "score"]
+        residual = collective_anomaly[0, "residual"]
+        impact_factor = collective_anomaly["value"].sum() - collective_anomaly["threshold"].sum()
+        return (start_date, end_date, peak, score, residual, impact_factor)
+
     def anomalies(self):
         points_over_threshold = self.annotated_series.filter(pl.col("anomaly"))
         groups = [list(group) for group in consecutive_groups(points_over_threshold["index"])]
         
         def group_to_anomaly(group):
-            collective_anomaly = self.annotated_series[group]
-            start_date, end_date = collective_anomaly[[0, -1], "date"]
-            peak = collective_anomaly[collective_anomaly["value"].arg_max(), "date"]
-            score = collective_anomaly[0, "score"]
-            residual = collective_anomaly[0, "residual"]
-            impact_factor = collective_anomaly["value"].sum() - collective_anomaly["threshold"].sum()
-            return (start_date, end_date, peak, score, residual, impact_factor)
+            return self._collective_anomaly_to_tuple(self.annotated_series[group])
         
         anomalies = [anomaly for group in groups if (anomaly := group_to_anomaly(group)) is not None]
 
-        return pl.DataFrame(anomalies, schema=["start", "end", "peak", ("score", float), ("residual", float), ("impact", float)], orient="row")
+        return pl.DataFrame(anomalies, schema=ANOMALY_SCHEMA, orient="row")
 
     def run(self, series: pl.DataFrame):
-        self.annotated_series = series.clone().with_row_index().with_columns(
-            pl.lit(False).alias("anomaly"),
-            pl.lit(np.nan).alias("score"),
-            pl.lit(np.nan).alias("residual"),
-            pl.lit(np.nan).alias("threshold"),
-            pl.lit(np.nan).alias("min_score"),
-            pl.lit(np.nan).alias("cov2"),
-            pl.lit(np.nan).alias("adi"),
-            pl.lit(DemandCategorization.NONE).alias("demand_pattern"))
-        
-        for idx, (date, value) in enumerate(series.iter_rows()):
-            if idx < self._window._min_observations:
-                if value > 0: self._window.insert(value, idx + 1)
-                continue
+        instrumentation = self.instrumentation
+        run_start = instrumentation.start()
 
-            interarrival = idx - self._window._last_arrival if self._window._last_arrival is not None else -1
-            if not self._active_anomaly and interarrival >= self._window._capacity: 
-                self._window.clear()
+        rows = [self.step(date, value) for date, value in series.iter_rows()]
 
-            score = 0 if not self._active_anomaly else np.inf
-            residual = 0 if not self._active_anomaly else np.inf
+        schema = [("index", pl.UInt32), *series.schema.items(), *ANNOTATION_SCHEMA]
+        self.annotated_series = pl.DataFrame(rows, schema=schema, orient="row")
+
+        instrumentation.record("run", run_start)
+        return self.annotated_series
 
-            # don't recategorize demand in middle of anomaly
-            demand_categorization = self._window.classify_demand(idx) if not self._active_anomaly else DemandCategorization(self.annotated_series[idx - 1, "demand_pattern"])
+    def stream(self, points):
+        """
+        Runs anomaly detection point by point over an iterable of (date, value) pairs without
+        materializing the series, so memory is bounded by the window and the longest spike.
+
+        Yields:
+            tuple: (row, anomaly), where row is the annotated point (index, date, value, then ANNOTATION_SCHEMA columns)
+                   and anomaly is a spike (as in anomalies()) which ended at this point, or None
+        """
+        spike = []
+        for date, value in points:
+            row = self.step(date, value)
+
+            anomaly = None
+            if row[3]:
+                spike.append(row)
+            elif spike:
+                anomaly, spike = self._spike_to_anomaly(spike), []
+            yield row, anomaly
+
+        if spike: yield None, self._spike_to_anomaly(spike)
+
+    def _spike_to_anomaly(self, spike):
+        return self._collective_anomaly_to_tuple(pl.DataFrame(spike, schema=["index", "date", "value", *ANNOTATION_SCHEMA], orient="row"))
+
+    def step(self, date, value):
+        """
+        Processes the next point of a series and returns it annotated as a tuple
+        (index, date, value, anomaly, score, residual, threshold, min_score, cov2, adi, demand_pattern).
+        """
+        instrumentation = self.instrumentation
+        idx = self._index
+        previous = self._previous
+        self._index += 1
+
+        if idx < self._window._min_observations:
+            if value > 0: self._window.insert(value, idx + 1)
+            self._previous = (idx, date, value, False, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, str(DemandCategorization.NONE))
+            return self._previous
+
+        point_start = instrumentation.start()
+        _, _, previous_value, _, _, _, previous_threshold, _, _, _, previous_demand_pattern = previous
+
+        interarrival = idx - self._window._last_arrival if self._window._last_arrival is not None else -1
+        if not self._active_anomaly and interarrival >= self._window._capacity: 
+            self._window.clear()
+            instrumentation.count("window_clear")
+
+        score = 0 if not self._active_anomaly else np.inf
+        residual = 0 if not self._active_anomaly else np.inf
+
+        # don't recategorize demand in middle of anomaly
+        demand_categorization = self._window.classify_demand(idx) if not self._active_anomaly else DemandCategorization(previous_demand_pattern)
+        
+        if value > 0 and demand_categorization in (DemandCategorization.NONE, DemandCategorization.LUMPY, DemandCategorization.INTERMITTENT):
+            if not self._active_anomaly:
+                self.croston = CrostonSBA(self._window.to_array())
             
-            if value > 0 and demand_categorization in (DemandCategorization.NONE, DemandCategorization.LUMPY, DemandCategorization.INTERMITTENT):
-                if not self._active_anomaly:
-                    self.croston = CrostonSBA(self._window.to_array())
-                
-                forecast = 0 if len(self._window) == 0 else self.croston.forecast()
-                residual = value - forecast
-            elif value > 0 and demand_categorization in (DemandCategorization.SMOOTH, DemandCategorization.ERRATIC):
-                if self.annotated_series[idx - 1, "demand_pattern"] in (DemandCategorization.LUMPY, DemandCategorization.INTERMITTENT): # DemandCategorization.NONE,
+            if len(self._window) == 0: forecast = 0
+            else:
+                with instrumentation.timer("croston_forecast"): forecast = self.croston.forecast()
+            residual = value - forecast
+        elif value > 0 and demand_categorization in (DemandCategorization.SMOOTH, DemandCategorization.ERRATIC):
+            if previous_demand_pattern in (DemandCategorization.LUMPY, DemandCategorization.INTERMITTENT): # DemandCategorization.NONE,
+                with instrumentation.timer("winsorize"):
                     self._window._window = winsorize(self._window._window, limits=(0, 0.05))
+            with instrumentation.timer("score"):
                 score = self.score(value)
-            
-            new_anomaly = not self._active_anomaly and (score >= self._min_score or residual >= self._min_residual)
-            return_to_normal = self._active_anomaly and (score < self._min_score or residual < self._min_residual or np.isclose(value, 0))
-            new_normal = self._active_anomaly and self._efficiency_ratio.efficiency_ratio() < self._efficiency
-
-            self._active_anomaly = (new_anomaly or self._active_anomaly) and not (return_to_normal or new_normal)
-
-            if new_anomaly:
-                self._intermittent_demand_anomaly = demand_categorization in (DemandCategorization.NONE, DemandCategorization.LUMPY, DemandCategorization.INTERMITTENT)
-                threshold = self.threshold(value) if not self._intermittent_demand_anomaly else forecast + self._min_residual
-                self._efficiency_ratio.insert(self.annotated_series[idx - 1, "value"])
-            if self._active_anomaly: 
-                self._efficiency_ratio.insert(value)
-
-            if new_normal or return_to_normal:
-                anomaly = self._efficiency_ratio[1:]
-                target_mean = self._window.mean() if return_to_normal else value
-                target_std = self._window.std()
-
-                if self._intermittent_demand_anomaly and new_normal:
-                    self._window.clear()
-                    self._window._last_arrival = idx - len(anomaly)
-                
-                for i, point in enumerate(anomaly): self._window.insert(point, idx - len(anomaly) + i + 1)
-
-                # with small smoothing constant, affects of outliers are mitigated during simple exponential
-                # smoothing during Croston's method, so don't need to flatten
-                if not self._intermittent_demand_anomaly:
-                    # if anomaly in smooth window, rescale
-                    self._window._window = ((self._window.window - self._window.mean()) / self._window.window.std()) * target_std + target_mean
-                elif new_normal:
-                    anomaly_mean = anomaly.mean()
-                    self._window._window = self._window.window * (target_mean / anomaly_mean)
-                
-                self._intermittent_demand_anomaly = False
-                self._efficiency_ratio.clear()
-
-            self.annotated_series[idx, "anomaly"] = self._active_anomaly
-            self.annotated_series[idx, "score"] = score
-            self.annotated_series[idx, "residual"] = residual
-            self.annotated_series[idx, "threshold"] = threshold if new_anomaly else (self.annotated_series[idx - 1, "threshold"] if self._active_anomaly else np.nan)
-            self.annotated_series[idx, "min_score"] = self._min_score
-            self.annotated_series[idx, "cov2"] = self._window.cov() ** 2 if (not self._active_anomaly) or new_anomaly else self.annotated_series[idx, "cov2"]
-            self.annotated_series[idx, "adi"] = self._window.average_interdemand_interval(idx) if (not self._active_anomaly) or new_anomaly else self.annotated_series[idx, "adi"]
-            self.annotated_series[idx, "demand_pattern"] = str(demand_categorization)
-
-            if not self._active_anomaly and value > 0: self._window.insert(value, idx + 1)
         
-        return self.annotated_series
+        new_anomaly = not self._active_anomaly and (score >= self._min_score or residual >= self._min_residual)
+        return_to_normal = self._active_anomaly and (score < self._min_score or residual < self._min_residual or np.isclose(value, 0))
+        new_normal = self._active_anomaly and self._efficiency_ratio.efficiency_ratio() < self._efficiency
+
+        self._active_anomaly = (new_anomaly or self._active_anomaly) and not (return_to_normal or new_normal)
+
+        if new_anomaly:
+            self._intermittent_demand_anomaly = demand_categorization in (DemandCategorization.NONE, DemandCategorization.LUMPY, DemandCategorization.INTERMITTENT)
+            threshold = self.threshold(value) if not self._intermittent_demand_anomaly else forecast + self._min_residual
+            self._efficiency_ratio.insert(previous_value)
+        if self._active_anomaly: 
+            self._efficiency_ratio.insert(value)
+
+        if new_normal or return_to_normal:
+            rescale_start = instrumentation.start()
+            anomaly = self._efficiency_ratio[1:]
+            target_mean = self._window.mean() if return_to_normal else value
+            target_std = self._window.std()
+
+            if self._intermittent_demand_anomaly and new_normal:
+                self._window.clear()
+                instrumentation.count("window_clear")
+                self._window._last_arrival = idx - len(anomaly)
+            
+            for i, point in enumerate(anomaly): self._window.insert(point, idx - len(anomaly) + i + 1)
+
+            # with small smoothing constant, affects of outliers are mitigated during simple exponential
+            # smoothing during Croston's method, so don't need to flatten
+            if not self._intermittent_demand_anomaly:
+                # if anomaly in smooth window, rescale
+                self._window._window = ((self._window.window - self._window.mean()) / self._window.window.std()) * target_std + target_mean
+            elif new_normal:
+                anomaly_mean = anomaly.mean()
+                self._window._window = self._window.window * (target_mean / anomaly_mean)
+            
+            self._intermittent_demand_anomaly = False
+            self._efficiency_ratio.clear()
+            instrumentation.record("rescale", rescale_start)
+
+        # window statistics are only recorded outside of anomalies
+        record_window = (not self._active_anomaly) or new_anomaly
+
+        row = (idx, date, value,
+               bool(self._active_anomaly),
+               float(score),
+               float(residual),
+               float(threshold if new_anomaly else (previous_threshold if self._active_anomaly else np.nan)),
+               float(self._min_score),
+               float(self._window.cov() ** 2 if record_window else np.nan),
+               float(self._window.average_interdemand_interval(idx) if record_window else np.nan),
+               str(demand_categorization))
+
+        if not self._active_anomaly and value > 0: self._window.insert(value, idx + 1)
+
+        instrumentation.record("point", point_start, demand_pattern=str(demand_categorization))
+        self._previous = row
+        return row
 
 
 class ChebyshevInequality(AnomalyDetector):
@@ -277,7 +344,8 @@ class ChebyshevInequality(AnomalyDetector):
     def score(self, x):
         mu = self._window.mean()
         sigma = self._window.std()
-        self._min_score = self.z if self._window.normality() else self.k
+        with self.instrumentation.timer("shapiro"):
+            self._min_score = self.z if self._window.normality() else self.k
         return (x - mu) / sigma
     
     def threshold(self, initial_guess):
@@ -308,6 +376,7 @@ class MedianMethod(AnomalyDetector):
 class IsolationForest(AnomalyDetector):
     def __init__(self, window, min_score=0.8, min_residual=1, efficiency=0.05):
         super().__init__(window, min_residual=min_residual, efficiency=efficiency)
+        import isotree
         self._iforest = isotree.IsolationForest(ntrees=10, categ_cols=None, nthreads=1)
         self._min_score = min_score
 
@@ -319,13 +388,17 @@ class IsolationForest(AnomalyDetector):
             return np.nan
         
     def threshold(self, initial_guess):
-        threshold = minimize_scalar(lambda x: np.abs(self.score(x) - self._min_score), bounds=(self._window.mean(), initial_guess)).x
+        with self.instrumentation.timer("threshold_search"):
+            result = minimize_scalar(lambda x: np.abs(self.score(x) - self._min_score), bounds=(self._window.mean(), initial_guess))
+        self.instrumentation.count("threshold_search_iterations", result.nit)
+        threshold = result.x
         return threshold if not np.isclose(threshold, initial_guess) else self._window.mean()
 
 
 class LocalOutlierFactor(AnomalyDetector):
     def __init__(self, window, min_score=1, min_residual=1, efficiency=0.05):
         super().__init__(window, min_residual=min_residual, efficiency=efficiency)
+        import sklearn.neighbors
         self._lof = sklearn.neighbors.LocalOutlierFactor(n_neighbors=window - 1, p=1)
         self._min_score = min_score
 
@@ -338,5 +411,8 @@ class LocalOutlierFactor(AnomalyDetector):
             return np.nan
         
     def threshold(self, initial_guess):
-        threshold = minimize_scalar(lambda x: np.abs(self.score(x) - self._min_score), bounds=(self._window.mean(), initial_guess)).x
+        with self.instrumentation.timer("threshold_search"):
+            result = minimize_scalar(lambda x: np.abs(self.score(x) - self._min_score), bounds=(self._window.mean(), initial_guess))
+        self.instrumentation.count("threshold_search_iterations", result.nit)
+        threshold = result.x
         return threshold if not np.isclose(threshold, initial_guess) else self._window.mean()
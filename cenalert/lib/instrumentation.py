@@ -0,0 +1,85 @@
+import os
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+class Instrumentation():
+    """
+    Collects counters and cumulative timers from the hot path of AnomalyDetector.run.
+    A single instance can be shared by several detectors (e.g., during parameter tuning) to aggregate across runs.
+    """
+    enabled = True
+
+    def __init__(self, max_trace_events=1_000_000):
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.demand_patterns = defaultdict(float)
+        self._trace = []
+        self._max_trace_events = max_trace_events
+        self._dropped_trace_events = 0
+        self._origin = time.perf_counter_ns()
+
+    def start(self):
+        return time.perf_counter_ns()
+
+    def record(self, name, start, demand_pattern=None):
+        """
+        Records an operation of type `name` which began at `start` (as returned by start()).
+        If `demand_pattern` is given, the time is also attributed to that demand pattern.
+        """
+        end = time.perf_counter_ns()
+        self.counters[name] += 1
+        self.timers[name] += (end - start) / 1e9
+        if demand_pattern is not None: self.demand_patterns[demand_pattern] += (end - start) / 1e9
+
+        if len(self._trace) < self._max_trace_events:
+            self._trace.append((name, start - self._origin, end - start, demand_pattern))
+        else:
+            self._dropped_trace_events += 1
+
+    @contextmanager
+    def timer(self, name):
+        start = self.start()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def to_dict(self):
+        return {"counters": dict(self.counters),
+                "timers": dict(self.timers),
+                "demand_patterns": dict(self.demand_patterns),
+                "dropped_trace_events": self._dropped_trace_events}
+
+    def write_json(self, path):
+        with open(path, "w") as file: json.dump(self.to_dict(), file, indent=2)
+
+    def write_chrome_trace(self, path):
+        """
+        Writes recorded operations in the Chrome trace event format (viewable in chrome://tracing or Perfetto).
+        """
+        pid = os.getpid()
+        events = [{"name": name, "cat": demand_pattern or "detector", "ph": "X", "ts": start / 1e3, "dur": duration / 1e3, "pid": pid, "tid": 0}
+                  for name, start, duration, demand_pattern in self._trace]
+        with open(path, "w") as file: json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+_NULL_CONTEXT = nullcontext()
+
+class NullInstrumentation():
+    """
+    Default instrumentation which records nothing.
+    """
+    enabled = False
+
+    def start(self): return 0
+    def record(self, name, start, demand_pattern=None): pass
+    def timer(self, name): return _NULL_CONTEXT
+    def count(self, name, n=1): pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
@@ -0,0 +1,74 @@
+import os
+import glob
+import json
+import hashlib
+
+import numpy as np
+import polars as pl
+
+def build_matrix(series_directory, output):
+    """
+    Converts a directory of per-country time series (<CC>.csv with date and value columns) into a single
+    aligned matrix of countries × dates, stored as <output>/values.npy (float64) and <output>/index.json
+    (country and date axes). Dates missing from a country's series are stored as NaN.
+
+    Returns:
+        tuple: The shape of the matrix
+    """
+    paths = sorted(glob.glob(os.path.join(series_directory, "*.csv")))
+    if not paths: raise FileNotFoundError(f"No time series found in {series_directory}")
+    countries = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+
+    dates = pl.concat([pl.read_csv(path, columns=["date"], try_parse_dates=True)["date"] for path in paths]).unique().sort()
+    axis = pl.DataFrame({"date": dates})
+
+    os.makedirs(output, exist_ok=True)
+    values = np.lib.format.open_memmap(os.path.join(output, "values.npy"), mode="w+", dtype=np.float64, shape=(len(countries), len(dates)))
+    for i, path in enumerate(paths):
+        series = pl.read_csv(path, try_parse_dates=True)
+        values[i] = axis.join(series, on="date", how="left")["value"].cast(pl.Float64).fill_null(np.nan).to_numpy()
+    values.flush()
+
+    with open(os.path.join(output, "index.json"), "w") as file:
+        json.dump({"countries": countries, "dates": [str(date) for date in dates], "dtype": str(dates.dtype)}, file)
+
+    return values.shape
+
+
+class SeriesMatrix():
+    """
+    Read-only view of a matrix built by build_matrix. Values are memory-mapped, so all processes
+    opening the same matrix share the same pages of the page cache.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, "index.json")) as file: index = json.load(file)
+        self.values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        self.countries = index["countries"]
+        self._rows = {country: i for i, country in enumerate(self.countries)}
+
+        dates = pl.Series("date", index["dates"])
+        self.dates = dates.str.to_date() if index["dtype"] == "Date" else dates.str.to_datetime()
+
+    def __contains__(self, country):
+        return country in self._rows
+
+    def row(self, country):
+        if country not in self._rows: raise KeyError(f"{country} is not in the series matrix")
+        return self.values[self._rows[country]]
+
+    def series(self, country):
+        """
+        Returns the time series of a country as a data frame with date and value columns,
+        in the same form as reading <CC>.csv.
+        """
+        row = self.row(country)
+        present = ~np.isnan(row)
+        return pl.DataFrame({"date": self.dates.filter(pl.Series(present)), "value": row[present]})
+
+    def hash(self, country):
+        """
+        Returns a digest of a country's series, used in place of a file hash for the result cache.
+        """
+        digest = hashlib.sha256(self.row(country).tobytes())
+        digest.update(json.dumps([str(self.dates[0]), str(self.dates[-1]), len(self.dates)]).encode())
+        return digest.hexdigest()
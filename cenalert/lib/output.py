@@ -0,0 +1,85 @@
+import os
+
+import polars as pl
+
+from cenalert.lib.detection import DemandCategorization
+
+DEMAND_PATTERNS = pl.Enum([str(pattern) for pattern in DemandCategorization])
+
+def temporal(df: pl.DataFrame, column: str):
+    """
+    Returns an expression converting `column` to a temporal type. Date and Datetime columns (e.g., hourly series)
+    are kept as they are, and strings are parsed as datetimes if they include a time of day.
+    """
+    dtype = df.schema[column]
+    if dtype.is_temporal(): return pl.col(column)
+    if dtype == pl.String: return pl.col(column).str.to_datetime() if df[column].str.contains(":").any() else pl.col(column).str.to_date()
+    return pl.col(column).cast(pl.Date)
+
+def typed_annotations(annotated: pl.DataFrame):
+    """
+    Casts an annotated series to the column types used for columnar output.
+    """
+    return annotated.with_columns(
+        temporal(annotated, "date"),
+        pl.col("index").cast(pl.UInt32),
+        pl.col("anomaly").cast(pl.Boolean),
+        pl.col("demand_pattern").cast(DEMAND_PATTERNS))
+
+def typed_anomalies(anomalies: pl.DataFrame):
+    """
+    Casts a set of (matched) anomalies to the column types used for columnar output.
+    """
+    return anomalies.with_columns(
+        *(temporal(anomalies, column) for column in ("start", "end", "peak")),
+        pl.col("proximity").cast(pl.Float64),
+        pl.col("cause").cast(pl.String),
+        pl.col("who").cast(pl.Categorical))
+
+def write_results(output: str, annotated: pl.DataFrame, anomalies: pl.DataFrame, explainable: pl.DataFrame, format="csv"):
+    """
+    Writes the results of a single run to `output` as annotated, anomalies and explainable files.
+
+    Parameters:
+        output (str): The output directory
+        annotated (DataFrame): The annotated time series
+        anomalies (DataFrame): All detected anomalies, matched against events
+        explainable (DataFrame): Anomalies within 6 days of an event
+        format (str): Either "csv" or "parquet"
+    """
+    os.makedirs(output, exist_ok=True)
+
+    if format == "csv":
+        annotated.write_csv(os.path.join(output, "annotated.csv"))
+        anomalies.write_csv(os.path.join(output, "anomalies.csv"))
+        explainable.write_csv(os.path.join(output, "explainable.csv"))
+    elif format == "parquet":
+        typed_annotations(annotated).write_parquet(os.path.join(output, "annotated.parquet"))
+        typed_anomalies(anomalies).write_parquet(os.path.join(output, "anomalies.parquet"))
+        typed_anomalies(explainable).write_parquet(os.path.join(output, "explainable.parquet"))
+    else:
+        raise ValueError(f"Unknown output format {format}")
+
+def append_to_dataset(dataset: str, country: str, algorithm: str, annotated: pl.DataFrame, anomalies: pl.DataFrame):
+    """
+    Adds the results of a single run to a consolidated dataset partitioned by country, i.e.
+    <dataset>/<table>/country=<country>/<algorithm>.parquet for the annotations and anomalies tables.
+    Results from a previous run with the same country and algorithm are replaced, so that
+    the dataset can be appended to as runs complete.
+    """
+    tables = {"annotations": typed_annotations(annotated), "anomalies": typed_anomalies(anomalies)}
+
+    for table, df in tables.items():
+        partition = os.path.join(dataset, table, f"country={country}")
+        os.makedirs(partition, exist_ok=True)
+
+        path = os.path.join(partition, f"{algorithm}.parquet")
+        df.with_columns(pl.lit(algorithm).cast(pl.Categorical).alias("algorithm")).write_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+def scan_dataset(dataset: str, table: str):
+    """
+    Lazily scans a table ("annotations" or "anomalies") of a consolidated dataset across all countries.
+    The country is recovered from the partition as a `country` column.
+    """
+    return pl.scan_parquet(os.path.join(dataset, table, "**", "*.parquet"), hive_partitioning=True)
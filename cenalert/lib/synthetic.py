@@ -0,0 +1,65 @@
+import datetime
+
+import numpy as np
+import polars as pl
+
+REGIMES = ["smooth", "sparse", "intermittent"]
+RESOLUTIONS = {"daily": datetime.timedelta(days=1), "hourly": datetime.timedelta(hours=1)}
+
+def generate_series(years=14, resolution="daily", regime="smooth", spikes_per_year=2, seed=None):
+    """
+    Generates a synthetic Google Trends-like time series for scaling tests.
+
+    Parameters:
+        years (int): Length of the series in years
+        resolution (str): Either "daily" or "hourly"
+        regime (str): "smooth" (always non-zero), "sparse" (mostly zero) or "intermittent"
+                      (alternating periods of activity and silence)
+        spikes_per_year (float): Expected number of injected spikes per year
+        seed (int): Seed for the random number generator
+
+    Returns:
+        DataFrame: A data frame with date and value columns, with values normalized to [0, 100]
+    """
+    rng = np.random.default_rng(seed)
+    step = RESOLUTIONS[resolution]
+    points_per_year = round(datetime.timedelta(days=365) / step)
+    n = years * points_per_year
+
+    level = 20 + 10 * np.sin(np.linspace(0, 2 * np.pi * years, n)) + np.cumsum(rng.normal(0, 0.05, n))
+    values = np.clip(level, 1, None) * rng.lognormal(0, 0.2, n)
+
+    if regime == "sparse":
+        values[rng.random(n) > 0.1] = 0
+    elif regime == "intermittent":
+        # runs of activity and silence with geometric lengths (mean ~ two weeks / one week of days)
+        active, i = True, 0
+        while i < n:
+            length = rng.geometric(1 / (14 if active else 7) / (points_per_year / 365))
+            if not active: values[i:i + length] = 0
+            active, i = not active, i + length
+    elif regime != "smooth":
+        raise ValueError(f"Unknown regime {regime}")
+
+    for start in rng.choice(n, size=rng.poisson(spikes_per_year * years), replace=False):
+        duration = max(1, round(rng.exponential(3) * points_per_year / 365))
+        end = min(n, start + duration)
+        decay = np.exp(-np.arange(end - start) / duration)
+        values[start:end] += rng.uniform(5, 20) * level[start] * decay
+
+    values = 100 * values / values.max()
+
+    start = datetime.datetime(2011, 1, 1)
+    dates = pl.datetime_range(start, start + (n - 1) * step, step, eager=True) if resolution == "hourly" \
+        else pl.date_range(start.date(), start.date() + (n - 1) * step, step, eager=True)
+
+    return pl.DataFrame({"date": dates, "value": values})
+
+def generate_countries(countries=1000, **kwargs):
+    """
+    Lazily generates synthetic series for many countries, yielding (code, series) pairs.
+    Codes are synthetic (S000, S001, ...); keyword arguments are passed to generate_series.
+    """
+    seed = kwargs.pop("seed", None)
+    for i in range(countries):
+        yield f"S{i:03d}", generate_series(**kwargs, seed=None if seed is None else seed + i)
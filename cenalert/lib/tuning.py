@@ -0,0 +1,278 @@
+import os
+import glob
+import json
+import pickle
+
+import numpy as np
+import polars as pl
+from pymoo.core.problem import ElementwiseProblem
+from pymoo.core.termination import Termination
+
+from cenalert.lib.detection import ChebyshevInequality, MedianMethod, IsolationForest, LocalOutlierFactor
+
+class OptimizeChebyshevInequality(ElementwiseProblem):
+    def __init__(self, df, instrumentation=None, **kwargs):
+        super().__init__(n_var=5,
+                         n_obj=2,
+                         n_ieq_constr=0,
+                         xl=np.array([30, 3, 5, 1, 0.01]),
+                         xu=np.array([90, 5, 18, 100, 0.1]),
+                         elementwise_evaluation=True,
+                         #vtype=np.array([int, int]),
+                         **kwargs)
+        self.df = df
+        self.instrumentation = instrumentation
+
+    def _evaluate(self, x, out, *args, **kwargs):
+        print("Running", x)
+        detector = ChebyshevInequality(window=round(x[0]), z=x[1], k=x[2], min_residual=x[3], efficiency=x[4])
+        if self.instrumentation is not None: detector.instrumentation = self.instrumentation
+        detector.run(self.df)
+        anomalies = detector.anomalies()
+        visibility = anomalies["impact"].sum()
+
+        out["F"] = [len(anomalies), -visibility]
+
+
+class OptimizeIsolationForest(ElementwiseProblem):
+    def __init__(self, df, instrumentation=None, **kwargs):
+        super().__init__(n_var=4,
+                         n_obj=2,
+                         n_ieq_constr=0,
+                         xl=np.array([30, 0.5, 1, 0.01]),
+                         xu=np.array([90, 1, 100, 0.1]),
+                         elementwise_evaluation=True,
+                         **kwargs)
+        self.df = df
+        self.instrumentation = instrumentation
+
+    def _evaluate(self, x, out, *args, **kwargs):
+        print("Running", x)
+        detector = IsolationForest(window=round(x[0]), min_score=x[1], min_residual=x[2], efficiency=x[3])
+        if self.instrumentation is not None: detector.instrumentation = self.instrumentation
+        detector.run(self.df)
+        anomalies = detector.anomalies()
+        visibility = anomalies["impact"].sum()
+
+        out["F"] = [len(anomalies), -visibility]
+
+
+class OptimizeMedianMethod(ElementwiseProblem):
+    def __init__(self, df, instrumentation=None, **kwargs):
+        super().__init__(n_var=4,
+                         n_obj=2,
+                         n_ieq_constr=0,
+                         xl=np.array([3, 0.5, 1, 0.05]),
+                         xu=np.array([31, 5, 100, 0.1]),
+                         elementwise_evaluation=True,
+                         **kwargs)
+        self.df = df
+        self.instrumentation = instrumentation
+
+    def _evaluate(self, x, out, *args, **kwargs):
+        print("Running", x)
+        detector = MedianMethod(half_neighborhood=round(x[0]), min_score=x[1], min_residual=x[2], efficiency=x[3])
+        if self.instrumentation is not None: detector.instrumentation = self.instrumentation
+        detector.run(self.df)
+        anomalies = detector.anomalies()
+        visibility = anomalies["impact"].sum()
+        print(len(anomalies), visibility)
+
+        out["F"] = [len(anomalies), -visibility]
+
+
+class OptimizeLocalOutlierFactor(ElementwiseProblem):
+    def __init__(self, df, instrumentation=None, **kwargs):
+        super().__init__(n_var=4,
+                         n_obj=2,
+                         n_ieq_constr=0,
+                         xl=np.array([30, 1.1, 1, 0.05]),
+                         xu=np.array([90, 5, 100, 0.1]),
+                         elementwise_evaluation=True,
+                         **kwargs)
+        self.df = df
+        self.instrumentation = instrumentation
+
+    def _evaluate(self, x, out, *args, **kwargs):
+        print("Running", x)
+        detector = LocalOutlierFactor(half_neighborhood=round(x[0]), min_score=x[1], min_residual=x[2], efficiency=x[3])
+        if self.instrumentation is not None: detector.instrumentation = self.instrumentation
+        detector.run(self.df)
+        anomalies = detector.anomalies()
+        visibility = anomalies["impact"].sum()
+        print(len(anomalies), visibility)
+
+        out["F"] = [len(anomalies), -visibility]
+
+
+def minimize_with_surrogate(problem, algorithm, termination, fraction=0.25, min_evaluations=10):
+    """
+    Runs NSGA2 (`algorithm`) until `termination`, but pre-screens each offspring population with a random forest fitted
+    on all parameter sets evaluated so far. Offspring are ranked by the non-dominated rank of their optimistic prediction
+    (mean minus standard deviation across trees) among the current front and the other predictions, with ties broken
+    by crowding distance, and only the best `fraction` of them (but at least `min_evaluations`) are evaluated by running
+    the detector. The remaining offspring are assigned objectives worse than any seen so far, so they do not survive.
+
+    Returns:
+        tuple: (X, F, real evaluations, candidate parameter sets)
+    """
+    from pymoo.core.evaluator import Evaluator
+    from pymoo.util.nds.non_dominated_sorting import NonDominatedSorting
+    from pymoo.operators.survival.rank_and_crowding.metrics import calc_crowding_distance
+    from sklearn.ensemble import RandomForestRegressor
+
+    algorithm.setup(problem, termination=termination)
+    pop_size = algorithm.pop_size
+
+    evaluator = Evaluator()
+    X_seen, F_seen = np.empty((0, problem.n_var)), np.empty((0, problem.n_obj))
+    candidates = 0
+
+    def normalize(X): return (X - problem.xl) / (problem.xu - problem.xl)
+
+    while algorithm.has_next():
+        offspring = algorithm.ask()
+        X = offspring.get("X")
+        candidates += len(X)
+
+        if len(F_seen) < pop_size:
+            promising = np.ones(len(X), dtype=bool)
+        else:
+            model = RandomForestRegressor(n_estimators=50, min_samples_leaf=2, n_jobs=1).fit(normalize(X_seen), F_seen)
+            predictions = np.stack([tree.predict(normalize(X)) for tree in model.estimators_])
+            optimistic = predictions.mean(axis=0) - predictions.std(axis=0)
+
+            front = F_seen[NonDominatedSorting().do(F_seen, only_non_dominated_front=True)]
+            rank = NonDominatedSorting().do(np.vstack([front, optimistic]), return_rank=True)[1][len(front):]
+            crowding = np.zeros(len(X))
+            for r in np.unique(rank):
+                members = np.flatnonzero(rank == r)
+                crowding[members] = calc_crowding_distance(optimistic[members]) if len(members) > 2 else np.inf
+
+            promising = np.zeros(len(X), dtype=bool)
+            promising[np.lexsort((-crowding, rank))[:max(min_evaluations, int(np.ceil(fraction * len(X))))]] = True
+
+        evaluator.eval(problem, offspring[promising])
+        X_seen = np.vstack([X_seen, X[promising]])
+        F_seen = np.vstack([F_seen, offspring[promising].get("F")])
+
+        if not promising.all():
+            rejected = offspring[~promising]
+            rejected.set("F", np.tile(F_seen.max(axis=0) + 1, (len(rejected), 1)))
+            rejected.apply(lambda individual: individual.evaluated.update(["F", "G", "H"]))
+
+        algorithm.tell(infills=offspring)
+        print(f"Generation {algorithm.n_gen - 1}: evaluated {promising.sum()} of {len(X)} ({evaluator.n_eval} of {candidates} total)")
+
+    result = algorithm.result()
+    return result.X, result.F, evaluator.n_eval, candidates
+
+def front_distance(F, reference):
+    """
+    Compares a Pareto front against a reference front (e.g., from parameters/chebyshev_tuning).
+    Both fronts are normalized by the ideal and nadir points of the reference.
+
+    Returns:
+        dict: The inverted generational distance (IGD) of F from the reference, and the ratio of their hypervolumes
+    """
+    from pymoo.indicators.igd import IGD
+    from pymoo.indicators.hv import HV
+
+    ideal, nadir = reference.min(axis=0), reference.max(axis=0)
+    scale = np.where(nadir > ideal, nadir - ideal, 1)
+
+    def normalize(front): return (front - ideal) / scale
+
+    hv = HV(ref_point=np.full(reference.shape[1], 1.1))
+    return {"igd": IGD(normalize(reference))(normalize(F)), "hypervolume_ratio": hv(normalize(F)) / hv(normalize(reference))}
+
+
+def load_front(path):
+    """
+    Loads the parameter sets of a Pareto front stored either as JSON (as in parameters/chebyshev_tuning)
+    or as a pickle file produced by tune_parameters.
+
+    Returns:
+        ndarray: The parameter sets, one per row
+    """
+    if path.endswith(".json"):
+        with open(path) as file: front = json.load(file)
+    else:
+        with open(path, "rb") as file: front = pickle.load(file)
+    return np.array([solution for solution, _ in front], dtype=float)
+
+def series_statistics(series: pl.DataFrame):
+    """
+    Summarizes a time series by its level, variability, sparsity, autocorrelation and spikiness.
+    """
+    values = series["value"].to_numpy()
+    mean = values.mean()
+    lag = np.corrcoef(values[:-1], values[1:])[0, 1] if values.std() > 0 else 0
+    return np.array([mean, values.std() / mean if mean > 0 else 0, np.mean(values == 0), np.nan_to_num(lag), np.percentile(values, 99) / mean if mean > 0 else 0])
+
+def similar_countries(series: pl.DataFrame, fronts_directory, series_directory, count=3, exclude=None):
+    """
+    Returns the paths of the Pareto fronts in `fronts_directory` (<CC>.json or <CC>.pkl) of the `count`
+    countries whose series in `series_directory` have the closest statistics (after standardization) to `series`.
+    """
+    fronts = {os.path.splitext(os.path.basename(path))[0]: path for path in sorted(glob.glob(os.path.join(fronts_directory, "*.json")) + glob.glob(os.path.join(fronts_directory, "*.pkl")))}
+    countries = [country for country in fronts if country != exclude and os.path.exists(os.path.join(series_directory, f"{country}.csv"))]
+    if not countries: return []
+
+    statistics = np.array([series_statistics(pl.read_csv(os.path.join(series_directory, f"{country}.csv"))) for country in countries])
+    mean, std = statistics.mean(axis=0), np.where(statistics.std(axis=0) > 0, statistics.std(axis=0), 1)
+    distances = np.linalg.norm((statistics - mean) / std - (series_statistics(series) - mean) / std, axis=1)
+
+    return [fronts[countries[i]] for i in np.argsort(distances)[:count]]
+
+def initial_population(fronts, problem, pop_size=100, seed=None):
+    """
+    Builds an initial population from the parameter sets of prior Pareto fronts, clipped to the bounds
+    of `problem`. Prior parameter sets are sampled evenly across fronts if there are more than `pop_size`,
+    and the population is filled with random parameter sets if there are fewer.
+    """
+    rng = np.random.default_rng(seed)
+    fronts = [front for front in fronts if front.ndim == 2 and front.shape[1] == problem.n_var]
+    X = np.clip(np.vstack(fronts), problem.xl, problem.xu) if fronts else np.empty((0, problem.n_var))
+    X = np.unique(X, axis=0)
+
+    if len(X) > pop_size:
+        X = X[rng.choice(len(X), pop_size, replace=False)]
+    elif len(X) < pop_size:
+        X = np.vstack([X, rng.uniform(problem.xl, problem.xu, (pop_size - len(X), problem.n_var))])
+    return X
+
+
+class HypervolumeStagnation(Termination):
+    """
+    Terminates once the hypervolume of the current front has not improved by more than `tol` (relative)
+    for `patience` generations. Objectives are normalized by the ideal and nadir points of the first front.
+    """
+    def __init__(self, patience=10, tol=1e-3):
+        super().__init__()
+        self.patience = patience
+        self.tol = tol
+        self._indicator = None
+        self._ideal = None
+        self._scale = None
+        self._best = 0
+        self._stale = 0
+
+    def _update(self, algorithm):
+        from pymoo.indicators.hv import HV
+
+        if algorithm.opt is None: return 0.0
+        F = algorithm.opt.get("F")
+
+        if self._indicator is None:
+            self._ideal, nadir = F.min(axis=0), F.max(axis=0)
+            self._scale = np.where(nadir > self._ideal, nadir - self._ideal, 1)
+            self._indicator = HV(ref_point=np.full(F.shape[1], 1.1))
+
+        hypervolume = self._indicator((F - self._ideal) / self._scale)
+        if hypervolume > self._best * (1 + self.tol):
+            self._best, self._stale = hypervolume, 0
+        else:
+            self._stale += 1
+
+        return 1.0 if self._stale >= self.patience else self._stale / self.patience
@@ -0,0 +1,222 @@
+import os
+import sys
+import glob
+import json
+import time
+import pickle
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import polars as pl
+
+STAGES = ["stitch", "tune", "select", "run"]
+N_PARAMETERS = {"chebyshev": 5, "median": 4, "iforest": 4, "lof": 4}
+
+class Task():
+    """
+    A single stage for a single country. `action` is either a command line (list) which is run
+    as a subprocess, or a callable. The task is skipped if all outputs are newer than all inputs.
+    """
+    def __init__(self, country, stage, inputs, outputs, action):
+        self.country = country
+        self.stage = stage
+        self.inputs = inputs
+        self.outputs = outputs
+        self.action = action
+
+    def up_to_date(self):
+        if not all(os.path.exists(path) for path in self.inputs + self.outputs): return False
+        newest_input = max((os.path.getmtime(path) for path in self.inputs), default=0)
+        return min(os.path.getmtime(output) for output in self.outputs) >= newest_input
+
+    def __call__(self, log):
+        for output in self.outputs: os.makedirs(os.path.dirname(output), exist_ok=True)
+
+        if callable(self.action):
+            self.action()
+            return 0
+
+        with open(log, "w") as file:
+            return subprocess.run(self.action, stdout=file, stderr=subprocess.STDOUT).returncode
+
+
+def check_parameters(source, parameters, algorithm):
+    if len(parameters) != N_PARAMETERS[algorithm]:
+        raise ValueError(f"{source} has {len(parameters)} parameters, but {algorithm} takes {N_PARAMETERS[algorithm]}")
+
+def convert_front(source, destination, algorithm):
+    """
+    Converts a Pareto front stored as JSON (as in parameters/chebyshev_tuning) to the pickle format used by select_parameters.
+    """
+    front = [tuple(np.array(a) for a in solution) for solution in json.load(open(source))]
+    for solution, _ in front: check_parameters(source, solution, algorithm)
+    with open(destination, "wb") as file: pickle.dump(front, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+def convert_selected(source, destination, algorithm):
+    """
+    Converts selected parameters stored as JSON (as in parameters/chebyshev_selected) to the pickle format used by run.
+    """
+    parameters = tuple(np.float64(x) for x in json.load(open(source)))
+    check_parameters(source, parameters, algorithm)
+    with open(destination, "wb") as file: pickle.dump(parameters, file)
+
+def stamp(path, arguments):
+    """
+    Records the arguments of a stage in `path`. The file is only rewritten (and its mtime updated) when the
+    arguments differ from the previous run, so that it can serve as an input of the stage.
+
+    Returns:
+        str: The path of the stamp file
+    """
+    content = json.dumps(arguments)
+    try:
+        with open(path) as file: unchanged = file.read() == content
+    except FileNotFoundError:
+        unchanged = False
+
+    if not unchanged:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file: file.write(content)
+    return path
+
+def plan(country, args):
+    """
+    Returns the chain of tasks producing the results for a country.
+    """
+    python = [sys.executable, "-m"]
+    series = os.path.join(args.output, "series", f"{country}.csv") if args.data else os.path.join(args.series, f"{country}.csv")
+    front = os.path.join(args.output, "tuning", args.algorithm, f"{country}.pkl")
+    selected = os.path.join(args.output, "selected", args.algorithm, f"{country}.pkl")
+    events = os.path.join(args.events, f"{country}.csv") if args.events else None
+    results = os.path.join(args.output, "results", args.algorithm, country)
+    stamps = os.path.join(args.output, "stamps", args.algorithm)
+
+    tasks = []
+    if args.data:
+        windows = sorted(glob.glob(os.path.join(args.data, "**", "output*", country, "**", "*.csv"), recursive=True))
+        countries = os.path.join(args.output, "countries", f"{country}.txt")
+        os.makedirs(os.path.dirname(countries), exist_ok=True)
+        if not os.path.exists(countries):
+            with open(countries, "w") as file: file.write(f"{country}\n")
+        tasks.append(Task(country, "stitch", windows, [series],
+                          python + ["cenalert.stitch_windows", "--countries", countries, "--data", args.data, "--output", os.path.dirname(series)]))
+
+    if args.selected:
+        source = os.path.join(args.selected, f"{country}.json")
+        arguments = stamp(os.path.join(stamps, f"{country}.select.json"), ["convert_selected", source])
+        tasks.append(Task(country, "select", [source, arguments], [selected], lambda: convert_selected(source, selected, args.algorithm)))
+    else:
+        if args.fronts:
+            source = os.path.join(args.fronts, f"{country}.json")
+            arguments = stamp(os.path.join(stamps, f"{country}.tune.json"), ["convert_front", source])
+            tasks.append(Task(country, "tune", [source, arguments], [front], lambda: convert_front(source, front, args.algorithm)))
+        else:
+            command = ["cenalert.tune_parameters", "--series", series, "--algorithm", args.algorithm, "--output", front, "--n-eval", str(args.n_eval)]
+            arguments = stamp(os.path.join(stamps, f"{country}.tune.json"), command)
+            tasks.append(Task(country, "tune", [series, arguments], [front], python + command))
+        tasks.append(Task(country, "select", [front], [selected], python + ["cenalert.select_parameters", "--path", front, "--output", selected]))
+
+    command = ["cenalert.run", "--path", series, "--algorithm", args.algorithm, "--parameters", selected, "--output", results]
+    if events and os.path.exists(events): command += ["--events", events]
+    arguments = stamp(os.path.join(stamps, f"{country}.run.json"), command)
+    tasks.append(Task(country, "run", [series, selected, arguments] + ([events] if events and os.path.exists(events) else []),
+                      [os.path.join(results, f"{name}.csv") for name in ("annotated", "anomalies", "explainable")], python + command))
+
+    return tasks
+
+def execute(chains, jobs, logs):
+    """
+    Runs the tasks of all countries over a single pool of `jobs` workers. A country's next stage is
+    scheduled as soon as its previous stage completes, and later stages are preferred over earlier
+    ones so that results are produced as early as possible.
+
+    Returns:
+        list: (country, stage, status, start, end) for every task, with times relative to the start
+    """
+    origin = time.perf_counter()
+    records = []
+    ready = [chain.pop(0) for chain in chains.values() if chain]
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        while ready or running:
+            # depth-first: schedule the latest stage first
+            ready.sort(key=lambda task: STAGES.index(task.stage))
+            while ready and len(running) < jobs:
+                task = ready.pop()
+                if task.up_to_date():
+                    records.append((task.country, task.stage, "up-to-date", time.perf_counter() - origin, time.perf_counter() - origin))
+                    if chains[task.country]: ready.append(chains[task.country].pop(0))
+                    continue
+                log = os.path.join(logs, f"{task.country}.{task.stage}.log")
+                running[pool.submit(task, log)] = (task, time.perf_counter() - origin)
+
+            if not running: continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, start = running.pop(future)
+                try:
+                    status = "ok" if future.result() == 0 else "failed"
+                except Exception as e:
+                    print(f"{task.country} {task.stage}: {e}")
+                    status = "failed"
+
+                records.append((task.country, task.stage, status, start, time.perf_counter() - origin))
+                print(f"{task.country} {task.stage}: {status} ({records[-1][4] - start:.1f}s)")
+
+                if status == "ok" and chains[task.country]: ready.append(chains[task.country].pop(0))
+
+    return records
+
+def report(records, jobs):
+    df = pl.DataFrame(records, schema=["country", "stage", "status", "start", "end"], orient="row").with_columns((pl.col("end") - pl.col("start")).alias("duration"))
+    wall = df["end"].max() or 0
+
+    print(df.group_by("stage", "status").agg(pl.len().alias("tasks"), pl.col("duration").sum().alias("total"), pl.col("duration").mean().alias("mean"), pl.col("duration").max().alias("max"))
+            .sort(pl.col("stage").replace_strict(STAGES, list(range(len(STAGES)))), "status"))
+
+    # stages of a country run in sequence, so the longest chain bounds the wall time
+    chains = df.group_by("country").agg(pl.col("duration").sum()).sort("duration", descending=True)
+    busy = df["duration"].sum()
+    print(f"wall time: {wall:.1f}s, busy: {busy:.1f}s, utilization: {busy / (wall * jobs) if wall else 0:.0%} of {jobs} workers")
+    if len(chains): print(f"critical path: {chains[0, 'country']} ({chains[0, 'duration']:.1f}s)")
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description="Run stitching, parameter tuning, parameter selection and anomaly detection for several countries")
+    parser.add_argument("--countries", required=True, help="path to a text file with one country code per line")
+    parser.add_argument("--series", help="path to stitched time series directory")
+    parser.add_argument("--data", help="path to raw window data (stitch series instead of using --series)")
+    parser.add_argument("--fronts", help="path to Pareto fronts as JSON (skip parameter tuning)")
+    parser.add_argument("--selected", help="path to selected parameters as JSON (skip parameter tuning and selection)")
+    parser.add_argument("--events", help="path to directory of per-country events")
+    parser.add_argument("--algorithm", default="chebyshev", choices=["chebyshev", "median", "iforest", "lof"], help="anomaly detection algorithm to use")
+    parser.add_argument("--n-eval", type=int, default=5000, help="number of parameter sets to evaluate during tuning")
+    parser.add_argument("--output", required=True, help="path to output directory")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="number of workers")
+    parser.add_argument("--timings", help="path to output per-task timings (CSV)")
+    args = parser.parse_args()
+
+    if not args.series and not args.data:
+        parser.error("one of --series or --data is required")
+
+    try:
+        countries = pl.read_csv(args.countries, has_header=False, comment_prefix="#").to_series().to_list()
+    except FileNotFoundError as e:
+        print(e)
+        exit(1)
+
+    logs = os.path.join(args.output, "logs", args.algorithm)
+    os.makedirs(logs, exist_ok=True)
+
+    chains = {country: plan(country, args) for country in countries}
+    records = execute(chains, args.jobs, logs)
+    df = report(records, args.jobs)
+
+    if args.timings: df.write_csv(args.timings)
+    if (df["status"] == "failed").any(): exit(1)
+
+if __name__ == "__main__":
+    main()
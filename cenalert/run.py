@@ -5,17 +5,89 @@ import pickle
 
 import polars as pl
 
-from cenalert.lib.detection import ChebyshevInequality, MedianMethod, IsolationForest, LocalOutlierFactor
+from cenalert.lib.detection import ChebyshevInequality, MedianMethod, IsolationForest, LocalOutlierFactor, ANNOTATION_SCHEMA, ANOMALY_SCHEMA
 from cenalert.lib.event_match import match_all
+from cenalert.lib.output import write_results, append_to_dataset
+from cenalert.lib.instrumentation import Instrumentation
+from cenalert.lib.cache import ResultCache, DEFAULT_CACHE_DIRECTORY, file_hash, detection_key, matches_key
+from cenalert.lib.matrix import SeriesMatrix
+
+def read_points(path, chunk_size):
+    """
+    Lazily reads a time series in chunks of `chunk_size` rows, yielding (date, value) pairs.
+    """
+    reader = pl.read_csv_batched(path, try_parse_dates=True, batch_size=chunk_size)
+    while (batches := reader.next_batches(1)):
+        for batch in batches: yield from batch.iter_rows()
+
+def run_streaming(detector, points, events, output, chunk_size):
+    """
+    Runs anomaly detection point by point, flushing annotated points every `chunk_size` rows and
+    spikes as soon as they end. Spikes are written in chronological order rather than by impact.
+
+    Returns:
+        tuple: (number of spikes, summed impact, number of explainable spikes)
+    """
+    files = {name: open(os.path.join(output, f"{name}.csv"), "w") for name in ("annotated", "anomalies", "explainable")} if output else {}
+    header = {name: True for name in files}
+
+    def flush(name, df):
+        if name in files:
+            df.write_csv(files[name], include_header=header[name])
+            header[name] = False
+
+    schema = None
+    rows, count, impact, explainable = [], 0, 0, 0
+    try:
+        for row, anomaly in detector.stream(points):
+            if row is not None:
+                if schema is None:
+                    # dtypes of the date and value columns are taken from the first chunk
+                    schema = [("index", pl.UInt32), ("date", pl.DataFrame([row[1:3]], orient="row").dtypes[0]), ("value", pl.Float64), *ANNOTATION_SCHEMA]
+                rows.append(row)
+                if len(rows) >= chunk_size:
+                    flush("annotated", pl.DataFrame(rows, schema=schema, orient="row"))
+                    rows = []
+
+            if anomaly is not None:
+                match = match_all(pl.DataFrame([anomaly], schema=ANOMALY_SCHEMA, orient="row"), events)
+                explainable_match = match.filter((-6 <= pl.col("proximity")) & (pl.col("proximity") <= 6))
+                spike = match.row(0, named=True)
+                print(f"{spike['start']} - {spike['end']}: peak {spike['peak']}, impact {spike['impact']:.3f}, proximity {spike['proximity']}")
+
+                flush("anomalies", match)
+                flush("explainable", explainable_match)
+                count, impact, explainable = count + 1, impact + anomaly[-1], explainable + len(explainable_match)
+
+        if rows: flush("annotated", pl.DataFrame(rows, schema=schema, orient="row"))
+        # without any spikes, write a header-only file as in batch mode
+        for name in ("anomalies", "explainable"):
+            if header.get(name): flush(name, match_all(pl.DataFrame(), events))
+    finally:
+        for file in files.values(): file.close()
+
+    return count, impact, explainable
 
 def main():
     warnings.filterwarnings('ignore')
 
     parser = argparse.ArgumentParser(description="Run anomaly detection on a single time series")
-    parser.add_argument("--path", required=True, help="path to time series")
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument("--path", help="path to time series")
+    input_group.add_argument("--matrix", help="path to series matrix (see cenalert.build_matrix), used with --country")
     parser.add_argument("--events", required=False, help="events to match against")
     parser.add_argument("--algorithm", required=True, help="anomaly detection algorithm to use", choices=["chebyshev", "median", "iforest", "lof"])
     parser.add_argument("--parameters", required=True, help="path to algorithm parameters")
+    parser.add_argument("--format", default="csv", help="format of output files", choices=["csv", "parquet"])
+    parser.add_argument("--dataset", required=False, help="path to consolidated (country-partitioned) Parquet dataset to add results to")
+    parser.add_argument("--country", required=False, help="country code of the time series in the series matrix or the consolidated dataset (defaults to the name of the time series file)")
+    parser.add_argument("--profile", required=False, help="path to output detector counters and timers (JSON)")
+    parser.add_argument("--trace", required=False, help="path to output detector trace (Chrome trace format)")
+    parser.add_argument("--stream", action="store_true", help="read the time series in chunks and write results incrementally (CSV only)")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="number of rows to read and write at a time when streaming")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIRECTORY, help="directory of the result cache")
+    parser.add_argument("--cache-size", type=int, default=1024, help="maximum size of the result cache in megabytes")
+    parser.add_argument("--no-cache", action="store_true", help="always run anomaly detection, without reading or writing the result cache")
 
     output_group = parser.add_mutually_exclusive_group()
     output_group.add_argument("--output", help="path to output directory")
@@ -23,11 +95,19 @@ def main():
     
     args = parser.parse_args()
     if not args.dry_run: args.output = args.output or "."
+    if args.stream and (args.format != "csv" or args.dataset):
+        parser.error("--stream only supports CSV output")
+    if args.matrix and not args.country:
+        parser.error("--country is required with --matrix")
 
     try:
-        df = pl.read_csv(args.path, try_parse_dates=True)
+        if args.matrix:
+            matrix = SeriesMatrix(args.matrix)
+            df = matrix.series(args.country)
+        else:
+            df = pl.read_csv(args.path, try_parse_dates=True) if not args.stream else None
         with open(args.parameters, "rb") as file: parameters = list(pickle.load(file))
-    except FileNotFoundError as e:
+    except (FileNotFoundError, KeyError) as e:
         print(e)
         exit(1)
 
@@ -50,20 +130,62 @@ def main():
     elif args.algorithm == "lof":
         detector = LocalOutlierFactor(*parameters)
     
-    annotated = detector.run(df)
-    anomalies = detector.anomalies()
-    matches = match_all(anomalies, events)
+    if args.profile or args.trace:
+        detector.instrumentation = Instrumentation()
+
+    if args.stream:
+        if args.path and not os.path.exists(args.path):
+            print(f"No such file or directory: {args.path}")
+            exit(1)
+        if args.output: os.makedirs(args.output, exist_ok=True)
+
+        points = read_points(args.path, args.chunk_size) if args.path else df.iter_rows()
+        count, impact, explainable = run_streaming(detector, points, events, args.output, args.chunk_size)
+        print(impact)
+        print(count, explainable)
+
+        if args.profile: detector.instrumentation.write_json(args.profile)
+        if args.trace: detector.instrumentation.write_chrome_trace(args.trace)
+        return
+
+    # profiling measures anomaly detection, so it is never answered from the cache
+    cache = ResultCache(args.cache_dir, args.cache_size << 20) if not (args.no_cache or args.profile or args.trace) else None
+    if cache:
+        key = detection_key(matrix.hash(args.country) if args.matrix else file_hash(args.path), args.algorithm, parameters)
+        events_hash = matches_key(args.events)
+        cached = cache.load(key)
+
+    if cache and cached:
+        annotated, anomalies = cached["annotated"], cached["anomalies"]
+    else:
+        annotated = detector.run(df)
+        anomalies = detector.anomalies()
+
+    if cache and cached and cached["events"] == events_hash:
+        matches = cached["matches"]
+    else:
+        matches = match_all(anomalies, events)
+
+    if cache and not cached:
+        cache.store(key, annotated, anomalies, events_hash, matches)
+    elif cache and cached["events"] != events_hash:
+        cache.store_matches(key, events_hash, matches)
+
     explainable_events = matches.filter((-6 <= pl.col("proximity")) & (pl.col("proximity") <= 6))
     
     print(anomalies)
     print(anomalies["impact"].sum())
     print(len(anomalies), len(explainable_events))
 
+    if args.profile: detector.instrumentation.write_json(args.profile)
+    if args.trace: detector.instrumentation.write_chrome_trace(args.trace)
+
     if args.output:
-        os.makedirs(args.output, exist_ok=True)
-        annotated.write_csv(os.path.join(args.output, "annotated.csv"))
-        matches.sort("impact").write_csv(os.path.join(args.output, "anomalies.csv"))
-        explainable_events.sort("impact").write_csv(os.path.join(args.output, "explainable.csv"))
+        write_results(args.output, annotated, matches.sort("impact"), explainable_events.sort("impact"), format=args.format)
+
+    if args.dataset and not args.dry_run:
+        country = args.country or os.path.splitext(os.path.basename(args.path))[0]
+        append_to_dataset(args.dataset, country, args.algorithm, annotated, matches.sort("impact"))
 
 if __name__ == "__main__":
     main()
@@ -2,13 +2,8 @@ import argparse
 import pickle
 import warnings
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-
 import numpy as np
 from scipy.optimize import curve_fit
-from sklearn.metrics import r2_score
-from kneed import KneeLocator
 
 warnings.filterwarnings("ignore")
 
@@ -18,6 +13,35 @@ def negative_logarithm(x, a, b, c): return -a * np.log(x + b) + c
 def power_law_decay(x, a, b, k, c): return (a / ((x + b) ** k)) + c
 def inverse_sqrt(x, a, b, c): return (a / np.sqrt(x + b)) + c
 
+# equivalent to sklearn.metrics.r2_score, which is too expensive to import for a single call
+def r2_score(y, f_x): return 1 - np.sum((y - f_x) ** 2) / np.sum((y - np.mean(y)) ** 2)
+
+def knee_point(x, y, sensitivity=1.0):
+    """
+    Locates the knee of a convex decreasing curve with the Kneedle algorithm. Equivalent to
+    kneed.KneeLocator(x, y, curve="convex", direction="decreasing").knee, but kneed imports matplotlib.
+
+    Returns:
+        float: The x value of the knee, or None if there is no knee
+    """
+    x_normalized = (x - x.min()) / (x.max() - x.min())
+    y_normalized = (y - y.min()) / (y.max() - y.min())
+    difference = (y_normalized.max() - y_normalized) - x_normalized
+
+    previous = np.concatenate((difference[:1], difference[:-1]))
+    following = np.concatenate((difference[1:], difference[-1:]))
+    maxima = np.flatnonzero((difference >= previous) & (difference >= following))
+    minima = set(np.flatnonzero((difference <= previous) & (difference <= following)))
+    if not maxima.size: return None
+
+    thresholds = dict(zip(maxima, difference[maxima] - sensitivity * np.abs(np.diff(x_normalized).mean())))
+    for i in range(maxima[0], len(difference) - 1):
+        if i in thresholds: threshold, knee = thresholds[i], x[i]
+        if i in minima: threshold = 0.0
+        if difference[i + 1] < threshold: return knee
+
+    return None
+
 def fit(f, x, y):
     try:
         popt, _ = curve_fit(f, x, y)
@@ -65,8 +89,7 @@ def main():
 
     f_x = f(x, *popt) if r2 > 0.95 else np.poly1d(np.polyfit(x, y, 7))(x)
 
-    knee_locator = KneeLocator(x, f_x, curve="convex", direction="decreasing")
-    knee = knee_locator.knee if knee_locator.knee else min(x)
+    knee = knee_point(x, f_x) or min(x)
 
     preferred_tradeoff = next(filter(lambda key: key[0] == knee, pareto_front.keys()))
     hyperparameters = pareto_front[preferred_tradeoff]
@@ -74,6 +97,9 @@ def main():
     print(preferred_tradeoff, hyperparameters)
 
     if args.debug:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         sns.scatterplot(x=x, y=y)
         sns.lineplot(x=x, y=f_x)
         plt.axvline(x=preferred_tradeoff[0], linestyle="dashed", color="orange")
@@ -1,136 +1,107 @@
+import os
+import json
 import argparse
 import warnings
 import pickle
 
 import polars as pl
 import numpy as np
-from pymoo.core.problem import ElementwiseProblem
-from pymoo.algorithms.moo.nsga2 import NSGA2
-from pymoo.optimize import minimize
-
-from cenalert.lib.detection import ChebyshevInequality, MedianMethod, IsolationForest, LocalOutlierFactor
-
-class OptimizeChebyshevInequality(ElementwiseProblem):
-    def __init__(self, df, **kwargs):
-        super().__init__(n_var=5,
-                         n_obj=2,
-                         n_ieq_constr=0,
-                         xl=np.array([30, 3, 5, 1, 0.01]),
-                         xu=np.array([90, 5, 18, 100, 0.1]),
-                         elementwise_evaluation=True,
-                         #vtype=np.array([int, int]),
-                         **kwargs)
-        self.df = df
-
-    def _evaluate(self, x, out, *args, **kwargs):
-        print("Running", x)
-        detector = ChebyshevInequality(window=round(x[0]), z=x[1], k=x[2], min_residual=x[3], efficiency=x[4])
-        detector.run(self.df)
-        anomalies = detector.anomalies()
-        visibility = anomalies["impact"].sum()
-
-        out["F"] = [len(anomalies), -visibility]
-
-
-class OptimizeIsolationForest(ElementwiseProblem):
-    def __init__(self, df, **kwargs):
-        super().__init__(n_var=4,
-                         n_obj=2,
-                         n_ieq_constr=0,
-                         xl=np.array([30, 0.5, 1, 0.01]),
-                         xu=np.array([90, 1, 100, 0.1]),
-                         elementwise_evaluation=True,
-                         **kwargs)
-        self.df = df
-
-    def _evaluate(self, x, out, *args, **kwargs):
-        print("Running", x)
-        detector = IsolationForest(window=round(x[0]), min_score=x[1], min_residual=x[2], efficiency=x[3])
-        detector.run(self.df)
-        anomalies = detector.anomalies()
-        visibility = anomalies["impact"].sum()
-
-        out["F"] = [len(anomalies), -visibility]
-
-
-class OptimizeMedianMethod(ElementwiseProblem):
-    def __init__(self, df, **kwargs):
-        super().__init__(n_var=4,
-                         n_obj=2,
-                         n_ieq_constr=0,
-                         xl=np.array([3, 0.5, 1, 0.05]),
-                         xu=np.array([31, 5, 100, 0.1]),
-                         elementwise_evaluation=True,
-                         **kwargs)
-        self.df = df
-
-    def _evaluate(self, x, out, *args, **kwargs):
-        print("Running", x)
-        detector = MedianMethod(half_neighborhood=round(x[0]), min_score=x[1], min_residual=x[2], efficiency=x[3])
-        detector.run(self.df)
-        anomalies = detector.anomalies()
-        visibility = anomalies["impact"].sum()
-        print(len(anomalies), visibility)
-
-        out["F"] = [len(anomalies), -visibility]
-
-
-class OptimizeLocalOutlierFactor(ElementwiseProblem):
-    def __init__(self, df, **kwargs):
-        super().__init__(n_var=4,
-                         n_obj=2,
-                         n_ieq_constr=0,
-                         xl=np.array([30, 1.1, 1, 0.05]),
-                         xu=np.array([90, 5, 100, 0.1]),
-                         elementwise_evaluation=True,
-                         **kwargs)
-        self.df = df
-
-    def _evaluate(self, x, out, *args, **kwargs):
-        print("Running", x)
-        detector = LocalOutlierFactor(half_neighborhood=round(x[0]), min_score=x[1], min_residual=x[2], efficiency=x[3])
-        detector.run(self.df)
-        anomalies = detector.anomalies()
-        visibility = anomalies["impact"].sum()
-        print(len(anomalies), visibility)
-
-        out["F"] = [len(anomalies), -visibility]
-
-def run_hyperparameter_tuning(series, algorithm, output):
+
+from cenalert.lib.instrumentation import Instrumentation
+from cenalert.lib.matrix import SeriesMatrix
+
+def run_hyperparameter_tuning(series, algorithm, output, n_eval=5000, instrumentation=None, surrogate=False, reference=None, warm_start=None, patience=None):
+    # pymoo is only needed once tuning actually starts
+    from pymoo.algorithms.moo.nsga2 import NSGA2
+    from pymoo.core.termination import TerminateIfAny
+    from pymoo.termination import get_termination
+    from pymoo.operators.sampling.rnd import FloatRandomSampling
+    from pymoo.optimize import minimize
+
+    from cenalert.lib.tuning import OptimizeChebyshevInequality, OptimizeMedianMethod, OptimizeIsolationForest, OptimizeLocalOutlierFactor, minimize_with_surrogate, front_distance, initial_population, HypervolumeStagnation
+
     if algorithm == "chebyshev":
-        problem = OptimizeChebyshevInequality(series)
+        problem = OptimizeChebyshevInequality(series, instrumentation=instrumentation)
     elif algorithm == "median":
-        problem = OptimizeMedianMethod(series)
+        problem = OptimizeMedianMethod(series, instrumentation=instrumentation)
     elif algorithm == "iforest":
-        problem = OptimizeIsolationForest(series)
+        problem = OptimizeIsolationForest(series, instrumentation=instrumentation)
     elif algorithm == "lof":
-        problem = OptimizeLocalOutlierFactor(series)
-
-    algorithm = NSGA2()
-
-    res = minimize(problem,
-                algorithm,
-                ("n_eval", 5000),
-                verbose=True)
-
-    optimal_solutions = list(zip(res.X, res.F))
+        problem = OptimizeLocalOutlierFactor(series, instrumentation=instrumentation)
+
+    # prior Pareto fronts (parameter sets) seed the initial population instead of random sampling
+    algorithm = NSGA2(sampling=initial_population(warm_start, problem) if warm_start else FloatRandomSampling())
+
+    # with a surrogate, the budget is the number of generations NSGA2 would run with n_eval evaluations
+    termination = get_termination("n_gen", max(1, n_eval // algorithm.pop_size)) if surrogate else get_termination("n_eval", n_eval)
+    if patience: termination = TerminateIfAny(termination, HypervolumeStagnation(patience))
+
+    if surrogate:
+        X, F, evaluations, candidates = minimize_with_surrogate(problem, algorithm, termination)
+        print(f"Evaluated {evaluations} of {candidates} parameter sets ({candidates - evaluations} saved)")
+    else:
+        res = minimize(problem,
+                    algorithm,
+                    termination,
+                    verbose=True)
+        X, F = res.X, res.F
+        print(f"Evaluated {res.algorithm.evaluator.n_eval} parameter sets")
+
+    if reference is not None:
+        distance = front_distance(F, reference)
+        print(f"Distance from reference front: IGD {distance['igd']:.4f}, hypervolume ratio {distance['hypervolume_ratio']:.4f}")
+
+    optimal_solutions = list(zip(X, F))
     with open(output, "wb") as file: pickle.dump(optimal_solutions, file)
 
 def main():
     warnings.filterwarnings("ignore")
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--series", required=True, help="path to time series")
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument("--series", help="path to time series")
+    input_group.add_argument("--matrix", help="path to series matrix (see cenalert.build_matrix), used with --country")
+    parser.add_argument("--country", required=False, help="country code of the time series in the series matrix")
     parser.add_argument("--algorithm", required=True, help="algorithm for which to tune parameters", choices=["chebyshev", "median", "iforest", "lof"])
     parser.add_argument("--output", required=True, help="path to output Pareto optimal solutions")
+    parser.add_argument("--n-eval", type=int, default=5000, help="number of parameter sets to evaluate")
+    parser.add_argument("--surrogate", action="store_true", help="pre-screen parameter sets with a surrogate model and only evaluate promising ones")
+    parser.add_argument("--reference", required=False, help="path to a Pareto front (JSON, as in parameters/chebyshev_tuning) to compare the result against")
+    parser.add_argument("--warm-start", nargs="+", default=[], help="paths to prior Pareto fronts (JSON or pickle) to seed the initial population with")
+    parser.add_argument("--warm-start-similar", required=False, help="directory of Pareto fronts (<CC>.json or <CC>.pkl) from which to seed the initial population with the fronts of countries with similar series")
+    parser.add_argument("--similar-series", required=False, help="directory of time series for --warm-start-similar (defaults to the directory of --series)")
+    parser.add_argument("--similar-count", type=int, default=3, help="number of similar countries to seed the initial population from")
+    parser.add_argument("--patience", type=int, required=False, help="stop once the hypervolume of the front has not improved for this many generations (10 by default when warm starting)")
+    parser.add_argument("--profile", required=False, help="path to output detector counters and timers aggregated over all evaluations (JSON)")
+    parser.add_argument("--trace", required=False, help="path to output detector trace (Chrome trace format)")
     args = parser.parse_args()
+    if args.matrix and not args.country:
+        parser.error("--country is required with --matrix")
     
     try:
-        df = pl.read_csv(args.series, try_parse_dates=True)
-    except FileNotFoundError:
+        df = SeriesMatrix(args.matrix).series(args.country) if args.matrix else pl.read_csv(args.series, try_parse_dates=True)
+        reference = np.array([objectives for _, objectives in json.load(open(args.reference))]) if args.reference else None
+
+        from cenalert.lib.tuning import load_front, similar_countries
+
+        warm_start = list(args.warm_start)
+        if args.warm_start_similar:
+            country = args.country or os.path.splitext(os.path.basename(args.series))[0]
+            series_directory = args.similar_series or (os.path.dirname(args.series) if args.series else None)
+            if series_directory is None: parser.error("--similar-series is required with --matrix")
+            warm_start += similar_countries(df, args.warm_start_similar, series_directory, count=args.similar_count, exclude=country)
+        if warm_start: print("Warm starting from", " ".join(warm_start))
+        warm_start = [load_front(path) for path in warm_start]
+    except (FileNotFoundError, KeyError):
         exit(1)
 
-    run_hyperparameter_tuning(df, args.algorithm, args.output)
+    patience = args.patience if args.patience is not None else (10 if warm_start else None)
+
+    instrumentation = Instrumentation() if args.profile or args.trace else None
+    run_hyperparameter_tuning(df, args.algorithm, args.output, n_eval=args.n_eval, instrumentation=instrumentation, surrogate=args.surrogate, reference=reference, warm_start=warm_start, patience=patience)
+
+    if args.profile: instrumentation.write_json(args.profile)
+    if args.trace: instrumentation.write_chrome_trace(args.trace)
 
 if __name__ == "__main__":
     main()